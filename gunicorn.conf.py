@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration for the SRU Cyberspace Club secure server.
+
+Run with: gunicorn -c gunicorn.conf.py secure_server:app
+"""
+
+import os
+
+# Serve from the project directory so static files are found
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+# Behind nginx the app trusts X-Forwarded-For (see BEHIND_PROXY in
+# secure_server.py), so listen on loopback only; otherwise anyone who
+# can reach the port directly could forge their client IP
+host = '127.0.0.1' if os.environ.get('BEHIND_PROXY') else '0.0.0.0'
+bind = f"{host}:{os.environ.get('PORT', 8000)}"
+
+# Rate-limit counters and the IP block list are per process with the
+# in-memory limiter storage, so more than one worker would let clients
+# through N times the limit. Run a single threaded worker by default and
+# only pre-fork when rate limits live in a shared store such as Redis.
+# Even then, each worker keeps its own block list.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = 8
+keepalive = 5
+
+if workers > 1 and os.environ.get('RATELIMIT_STORAGE_URI', 'memory://').startswith('memory://'):
+    raise RuntimeError(
+        "WEB_CONCURRENCY > 1 requires a shared RATELIMIT_STORAGE_URI "
+        "(e.g. redis://localhost:6379/0)"
+    )
+
+# Import the app once in the master before forking, so every worker
+# shares the same SECRET_KEY (even a randomly generated one) and the
+# in-memory static file cache
+preload_app = True
+
+# Log to stdout/stderr; security events still go to security.log
+accesslog = '-'
+errorlog = '-'
@@ -7,9 +7,13 @@ Implements comprehensive security measures to protect against malicious attacks.
 from flask import Flask, render_template, request, jsonify, session, make_response, abort
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
+from limits import parse as parse_limit
 import os
-import uuid
+import sys
 import time
+import hashlib
 import logging
 from pathlib import Path
 from security import security_manager
@@ -28,13 +32,26 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(32))
 
-# Configure rate limiting
+# Behind nginx every request arrives from 127.0.0.1; trust one proxy hop
+# so rate limiting and IP blocking see the real client address
+if os.environ.get('BEHIND_PROXY'):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+
+# Configure rate limiting. Counters live in RATELIMIT_STORAGE_URI so they
+# are shared across worker processes (e.g. redis://localhost:6379/0);
+# the in-memory default is only accurate with a single process.
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://'),
     default_limits=["200 per day", "50 per hour"]
 )
 
+# Per-IP cap on every request, routed or not. Flask-Limiter skips requests
+# without an endpoint (404s, 405s), so this is enforced in security_checks
+# against the limiter's storage instead of as an application limit.
+REQUEST_LIMIT = parse_limit("20 per minute")
+
 # Security configuration
 app.config.update(
     SESSION_COOKIE_SECURE=True,
@@ -52,58 +69,99 @@ def security_checks():
         client_ip = request.remote_addr
         
         # Check if IP is blocked
-        if client_ip in security_manager.blocked_ips:
+        if security_manager.is_blocked(client_ip):
             logger.warning(f"Blocked request from blocked IP: {client_ip}")
             abort(403)
         
         # Rate limiting check
-        if not security_manager.rate_limit(client_ip, limit=20, window=60):
+        if not limiter.limiter.hit(REQUEST_LIMIT, 'request', client_ip):
             logger.warning(f"Rate limit exceeded for IP: {client_ip}")
             abort(429)
         
         # Check for suspicious request patterns
         if security_manager.is_suspicious_request(request):
             logger.warning(f"Suspicious request detected from IP: {client_ip}")
-            security_manager.blocked_ips.add(client_ip)
+            security_manager.block_ip(client_ip)
             abort(400)
-        
-        # Generate session ID if not exists
-        if 'session_id' not in session:
-            session['session_id'] = str(uuid.uuid4())
-        
-        # Clean expired session data periodically
-        if time.time() % 300 < 1:  # Every 5 minutes
-            security_manager.clean_session_data()
             
+    except HTTPException:
+        # Let the 403/429/400 responses above through unchanged
+        raise
     except Exception as e:
         logger.error(f"Security check error: {e}")
         abort(500)
 
+# Security headers are identical for every response, so the header set
+# (including the Content Security Policy) is built once at import time.
+_CSP = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com; "
+    "style-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com; "
+    "font-src 'self' https://cdnjs.cloudflare.com https://fonts.gstatic.com; "
+    "img-src 'self' data: https:; "
+    "connect-src 'self'; "
+    "frame-src 'self' https://calendar.google.com; "
+    "object-src 'none'; "
+    "base-uri 'self'; "
+    "form-action 'self'; "
+    "frame-ancestors 'none';"
+)
+
+_STATIC_SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+    'Permissions-Policy': 'geolocation=(), microphone=(), camera=()',
+    'Content-Security-Policy': _CSP,
+}
+
 @app.after_request
 def add_security_headers(response):
     """Add security headers to all responses"""
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-    response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
+    response.headers.update(_STATIC_SECURITY_HEADERS)
+    return response
+
+# Static assets are loaded once at startup and served from memory
+STATIC_DIR = Path(__file__).parent
+CSRF_PLACEHOLDER = b'{{CSRF}}'
+
+def _load_static(filename, content_type, inject_csrf=False):
+    """Read a static file into memory and compute its ETag"""
+    body = (STATIC_DIR / filename).read_bytes()
+    
+    # Pre-inject the CSRF placeholder so each request only does one replace
+    if inject_csrf:
+        body = body.replace(
+            b'</form>',
+            b'<input type="hidden" name="csrf_token" value="' + CSRF_PLACEHOLDER + b'"></form>'
+        )
     
-    # Content Security Policy
-    csp = (
-        "default-src 'self'; "
-        "script-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com; "
-        "style-src 'self' 'unsafe-inline' https://cdnjs.cloudflare.com https://fonts.googleapis.com; "
-        "font-src 'self' https://cdnjs.cloudflare.com https://fonts.gstatic.com; "
-        "img-src 'self' data: https:; "
-        "connect-src 'self'; "
-        "frame-src 'self' https://calendar.google.com; "
-        "object-src 'none'; "
-        "base-uri 'self'; "
-        "form-action 'self'; "
-        "frame-ancestors 'none';"
-    )
-    response.headers['Content-Security-Policy'] = csp
+    etag = 'sha256-' + hashlib.sha256(body).hexdigest()[:32]
+    return body, etag, content_type
+
+_STATIC = {
+    'index.html': _load_static('index.html', 'text/html; charset=utf-8', inject_csrf=True),
+    'styles.css': _load_static('styles.css', 'text/css; charset=utf-8'),
+    'script.js': _load_static('script.js', 'application/javascript; charset=utf-8'),
+}
+
+# The index page split around its CSRF placeholders, so each request only
+# joins the pieces around the token instead of scanning the whole page
+_INDEX_PARTS = _STATIC['index.html'][0].split(CSRF_PLACEHOLDER)
+
+def serve_static(filename):
+    """Serve a cached static file, answering revalidation with 304"""
+    body, etag, content_type = _STATIC[filename]
     
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.headers['Content-Type'] = content_type
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
     return response
 
 @app.route('/')
@@ -111,16 +169,12 @@ def index():
     """Serve the main page"""
     try:
         # Generate CSRF token for forms
-        csrf_token = security_manager.generate_csrf_token(session['session_id'])
-        
-        with open('index.html', 'r', encoding='utf-8') as f:
-            content = f.read()
+        csrf_token = security_manager.generate_csrf_token(session)
         
         # Inject CSRF token into forms
-        content = content.replace('</form>', f'<input type="hidden" name="csrf_token" value="{csrf_token}"></form>')
-        
-        response = make_response(content)
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response = make_response(csrf_token.encode().join(_INDEX_PARTS))
+        response.headers['Content-Type'] = _STATIC['index.html'][2]
+        response.headers['Cache-Control'] = 'no-store'
         return response
         
     except Exception as e:
@@ -131,12 +185,7 @@ def index():
 def styles():
     """Serve CSS file"""
     try:
-        with open('styles.css', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        response = make_response(content)
-        response.headers['Content-Type'] = 'text/css; charset=utf-8'
-        return response
+        return serve_static('styles.css')
         
     except Exception as e:
         logger.error(f"Error serving CSS: {e}")
@@ -146,12 +195,7 @@ def styles():
 def script():
     """Serve JavaScript file"""
     try:
-        with open('script.js', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        response = make_response(content)
-        response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-        return response
+        return serve_static('script.js')
         
     except Exception as e:
         logger.error(f"Error serving JavaScript: {e}")
@@ -164,7 +208,7 @@ def submit_form():
     try:
         # Validate CSRF token
         csrf_token = request.form.get('csrf_token')
-        if not security_manager.validate_csrf_token(session['session_id'], csrf_token):
+        if not security_manager.validate_csrf_token(session, csrf_token):
             logger.warning(f"CSRF token validation failed for IP: {request.remote_addr}")
             return jsonify({'error': 'Invalid request'}), 403
         
@@ -234,7 +278,7 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 def main():
-    """Start the secure Flask server"""
+    """Start the secure server under gunicorn"""
     port = int(os.environ.get('PORT', 8000))
     
     print("Starting Secure SRU Cyberspace Club Server...")
@@ -250,17 +294,13 @@ def main():
     print("   ✓ Content Security Policy")
     print("-" * 60)
     
+    # Hand the process over to gunicorn's pre-forked workers
+    config = str(Path(__file__).parent / 'gunicorn.conf.py')
     try:
-        app.run(
-            host='0.0.0.0',
-            port=port,
-            debug=False,  # Disable debug mode in production
-            threaded=True
-        )
-    except KeyboardInterrupt:
-        print("\nServer stopped by user")
-    except Exception as e:
-        print(f"ERROR: Server error: {e}")
+        os.execvp('gunicorn', ['gunicorn', '-c', config, 'secure_server:app'])
+    except OSError as e:
+        print(f"ERROR: Could not start gunicorn: {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
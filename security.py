@@ -1,37 +1,96 @@
 import re
+import functools
 import hashlib
+import hmac
+import itertools
 import secrets
+import threading
 import time
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 import html
+import ipaddress
+import socket
+
+# Patterns are compiled once at import time so the per-request checks
+# don't go through the re module cache on every call. Validation patterns
+# are unanchored and applied with fullmatch.
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.IGNORECASE | re.DOTALL)
+_EVENT_RE = re.compile(r'on\w+\s*=', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_NAME_RE = re.compile(r'[a-zA-Z\s\'-]+')
+
+# Characters and tokens stripped from user input before HTML encoding
+_DROP_TABLE = str.maketrans('', '', '<>"\'&')
+_DROP_TOKENS_RE = re.compile(r'javascript:|vbscript:|onload|onerror', re.IGNORECASE)
+
+_EMAIL_SUSPICIOUS_PATTERNS = [
+    r'javascript:',
+    r'vbscript:',
+    r'data:',
+    r'<script',
+    r'javascript\(',
+    r'vbscript\('
+]
+_EMAIL_SUSPICIOUS_RE = re.compile('|'.join(_EMAIL_SUSPICIOUS_PATTERNS), re.IGNORECASE)
+
+# Tags that should never show up in a request, fused into one alternation
+# so a single scan of the request covers all of them.
+_SUSPICIOUS_TAGS = sorted({
+    'applet', 'base', 'basefont', 'bgsound', 'button', 'comment', 'dir',
+    'embed', 'form', 'iframe', 'input', 'isindex', 'link', 'listing',
+    'marquee', 'menu', 'meta', 'nextid', 'object', 'param', 'plaintext',
+    'script', 'select', 'style', 'textarea', 'title', 'xmp',
+})
+_SUSPICIOUS_RE = re.compile(
+    r'<(?:' + '|'.join(_SUSPICIOUS_TAGS) + r')|javascript:|vbscript:'
+    # data: only where a URL or value starts, so e.g. '/metadata:x' is fine
+    r'''|(?:^|(?<=[?&=\s"'(<]))data:''',
+    re.IGNORECASE
+)
+
+# Private IP ranges
+_PRIVATE_NETS = [
+    ipaddress.ip_network('10.0.0.0/8'),
+    ipaddress.ip_network('172.16.0.0/12'),
+    ipaddress.ip_network('192.168.0.0/16')
+]
+
+# DNS answers are cached for up to 5 minutes; the time bucket in the key
+# makes entries from older windows miss and eventually fall out of the LRU
+DNS_CACHE_TTL = 300
+
+@functools.lru_cache(maxsize=4096)
+def _cached_gethostbyname(hostname, ttl_bucket):
+    return socket.gethostbyname(hostname)
+
+def _resolve(hostname):
+    """Resolve hostname to an IPv4 address, using the DNS cache"""
+    return _cached_gethostbyname(hostname, int(time.monotonic() // DNS_CACHE_TTL))
 
 class SecurityManager:
     def __init__(self):
-        self.csrf_tokens = {}
-        self.rate_limit_data = {}
         self.blocked_ips = set()
+        # Read-only copy of blocked_ips for the per-request check; rebuilt
+        # by block_ip/unblock_ip so readers never see a set mid-update
+        self._blocked_snapshot = frozenset()
+        # Guards blocked_ips; it is shared by every worker thread
+        self._lock = threading.Lock()
         
     def sanitize_input(self, user_input):
         """Sanitize user input to prevent XSS and injection attacks"""
         if not user_input:
             return ""
         
-        # Remove potentially dangerous characters
-        dangerous_chars = ['<', '>', '"', "'", '&', 'javascript:', 'vbscript:', 'onload', 'onerror']
-        sanitized = str(user_input)
-        
-        for char in dangerous_chars:
-            sanitized = sanitized.replace(char, '')
+        # Remove potentially dangerous characters and tokens
+        sanitized = str(user_input).translate(_DROP_TABLE)
+        sanitized = _DROP_TOKENS_RE.sub('', sanitized)
         
         # HTML encode remaining content
         sanitized = html.escape(sanitized)
         
         # Remove script tags and event handlers
-        script_pattern = r'<script[^>]*>.*?</script>'
-        event_pattern = r'on\w+\s*='
-        
-        sanitized = re.sub(script_pattern, '', sanitized, flags=re.IGNORECASE | re.DOTALL)
-        sanitized = re.sub(event_pattern, '', sanitized, flags=re.IGNORECASE)
+        sanitized = _SCRIPT_RE.sub('', sanitized)
+        sanitized = _EVENT_RE.sub('', sanitized)
         
         return sanitized.strip()
     
@@ -40,24 +99,17 @@ class SecurityManager:
         if not email:
             return False
         
+        # Cheap length and charset checks before running any regex
+        if not (5 <= len(email) <= 254) or not email.isascii():
+            return False
+        
         # Basic email format validation
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, email):
+        if not _EMAIL_RE.fullmatch(email):
             return False
         
         # Check for suspicious patterns
-        suspicious_patterns = [
-            r'javascript:',
-            r'vbscript:',
-            r'data:',
-            r'<script',
-            r'javascript\(',
-            r'vbscript\('
-        ]
-        
-        for pattern in suspicious_patterns:
-            if re.search(pattern, email, re.IGNORECASE):
-                return False
+        if _EMAIL_SUSPICIOUS_RE.search(email):
+            return False
         
         return True
     
@@ -66,124 +118,68 @@ class SecurityManager:
         if not name:
             return False
         
-        # Only allow letters, spaces, hyphens, and apostrophes
-        name_pattern = r'^[a-zA-Z\s\'-]+$'
-        if not re.match(name_pattern, name):
+        # Length validation (and a cheap charset check) before the regex
+        if not (2 <= len(name) <= 50) or not name.isascii():
             return False
         
-        # Length validation
-        if len(name) < 2 or len(name) > 50:
+        # Only allow letters, spaces, hyphens, and apostrophes
+        if not _NAME_RE.fullmatch(name):
             return False
         
         return True
     
-    def generate_csrf_token(self, session_id):
-        """Generate CSRF token for form protection"""
-        token = secrets.token_urlsafe(32)
-        self.csrf_tokens[session_id] = {
-            'token': token,
-            'timestamp': time.time()
-        }
-        return token
+    def generate_csrf_token(self, session):
+        """Generate CSRF token for form protection, stored in the signed session cookie"""
+        if 'csrf_token' not in session:
+            session['csrf_token'] = secrets.token_urlsafe(32)
+        return session['csrf_token']
     
-    def validate_csrf_token(self, session_id, token):
-        """Validate CSRF token"""
-        if session_id not in self.csrf_tokens:
-            return False
-        
-        stored_data = self.csrf_tokens[session_id]
-        
-        # Check if token matches
-        if stored_data['token'] != token:
-            return False
-        
-        # Check if token is expired (1 hour)
-        if time.time() - stored_data['timestamp'] > 3600:
-            del self.csrf_tokens[session_id]
+    def validate_csrf_token(self, session, token):
+        """Validate CSRF token against the one in the session cookie"""
+        stored = session.get('csrf_token')
+        if stored is None:
             return False
         
-        return True
+        # Compare as bytes: compare_digest rejects non-ASCII str arguments
+        return hmac.compare_digest(stored.encode(), (token or '').encode())
     
-    def rate_limit(self, ip_address, limit=10, window=60):
-        """Implement rate limiting to prevent abuse"""
-        current_time = time.time()
-        
-        if ip_address not in self.rate_limit_data:
-            self.rate_limit_data[ip_address] = []
-        
-        # Clean old requests
-        self.rate_limit_data[ip_address] = [
-            req_time for req_time in self.rate_limit_data[ip_address]
-            if current_time - req_time < window
-        ]
-        
-        # Check if limit exceeded
-        if len(self.rate_limit_data[ip_address]) >= limit:
-            return False
-        
-        # Add current request
-        self.rate_limit_data[ip_address].append(current_time)
-        return True
+    def block_ip(self, ip_address):
+        """Block an IP address"""
+        with self._lock:
+            self.blocked_ips.add(ip_address)
+            self._blocked_snapshot = frozenset(self.blocked_ips)
     
-    def is_suspicious_request(self, request_data):
+    def unblock_ip(self, ip_address):
+        """Unblock an IP address"""
+        with self._lock:
+            self.blocked_ips.discard(ip_address)
+            self._blocked_snapshot = frozenset(self.blocked_ips)
+    
+    def is_blocked(self, ip_address):
+        """Check if an IP address is blocked"""
+        return ip_address in self._blocked_snapshot
+    
+    def get_blocked_ips(self):
+        """Return a read-only snapshot of the blocked IP addresses"""
+        return self._blocked_snapshot
+    
+    def is_suspicious_request(self, req):
         """Detect suspicious request patterns"""
-        suspicious_patterns = [
-            r'<script',
-            r'javascript:',
-            r'vbscript:',
-            r'data:',
-            r'<iframe',
-            r'<object',
-            r'<embed',
-            r'<form',
-            r'<input',
-            r'<textarea',
-            r'<select',
-            r'<button',
-            r'<link',
-            r'<meta',
-            r'<style',
-            r'<base',
-            r'<bgsound',
-            r'<link',
-            r'<meta',
-            r'<title',
-            r'<xmp',
-            r'<plaintext',
-            r'<listing',
-            r'<marquee',
-            r'<applet',
-            r'<param',
-            r'<embed',
-            r'<object',
-            r'<basefont',
-            r'<isindex',
-            r'<dir',
-            r'<menu',
-            r'<listing',
-            r'<plaintext',
-            r'<xmp',
-            r'<nextid',
-            r'<comment',
-            r'<listing',
-            r'<plaintext',
-            r'<xmp',
-            r'<nextid',
-            r'<comment',
-            r'<listing',
-            r'<plaintext',
-            r'<xmp',
-            r'<nextid',
-            r'<comment'
+        # Only scan the parts of the request an attacker controls
+        candidates = [
+            req.path,
+            unquote(req.query_string.decode('latin-1')),
+            req.headers.get('User-Agent', ''),
+            req.headers.get('Referer', ''),
         ]
         
-        request_str = str(request_data).lower()
+        # Form bodies are only parsed on routes that accept them; before_request
+        # also runs for unrouted and 405 requests, whose bodies are left alone
+        if req.method == 'POST' and req.url_rule is not None and 'POST' in req.url_rule.methods:
+            # listvalues() so repeated keys can't hide values after the first
+            candidates.extend(itertools.chain.from_iterable(req.form.listvalues()))
         
-        for pattern in suspicious_patterns:
-            if re.search(pattern, request_str, re.IGNORECASE):
-                return True
-        
-        return False
+        return any(_SUSPICIOUS_RE.search(value) for value in candidates)
     
     def validate_url(self, url):
         """Validate URL to prevent open redirect attacks"""
@@ -212,56 +208,10 @@ class SecurityManager:
     def is_private_ip(self, hostname):
         """Check if hostname resolves to private IP"""
         try:
-            import socket
-            ip = socket.gethostbyname(hostname)
-            
-            # Private IP ranges
-            private_ranges = [
-                ('10.0.0.0', '10.255.255.255'),
-                ('172.16.0.0', '172.31.255.255'),
-                ('192.168.0.0', '192.168.255.255')
-            ]
-            
-            for start, end in private_ranges:
-                if self.ip_in_range(ip, start, end):
-                    return True
-            
-            return False
-        except:
-            return False
-    
-    def ip_in_range(self, ip, start, end):
-        """Check if IP is in range"""
-        try:
-            ip_int = int(''.join([f'{int(x):08b}' for x in ip.split('.')]), 2)
-            start_int = int(''.join([f'{int(x):08b}' for x in start.split('.')]), 2)
-            end_int = int(''.join([f'{int(x):08b}' for x in end.split('.')]), 2)
-            return start_int <= ip_int <= end_int
+            ip = ipaddress.ip_address(_resolve(hostname))
+            return any(ip in network for network in _PRIVATE_NETS)
         except:
             return False
-    
-    def clean_session_data(self):
-        """Clean expired session data"""
-        current_time = time.time()
-        
-        # Clean expired CSRF tokens
-        expired_sessions = [
-            session_id for session_id, data in self.csrf_tokens.items()
-            if current_time - data['timestamp'] > 3600
-        ]
-        
-        for session_id in expired_sessions:
-            del self.csrf_tokens[session_id]
-        
-        # Clean old rate limit data
-        for ip in list(self.rate_limit_data.keys()):
-            self.rate_limit_data[ip] = [
-                req_time for req_time in self.rate_limit_data[ip]
-                if current_time - req_time < 300  # 5 minutes
-            ]
-            
-            if not self.rate_limit_data[ip]:
-                del self.rate_limit_data[ip]
 
 # Global security manager instance
 security_manager = SecurityManager()
@@ -7,6 +7,7 @@ Contains additional security settings and monitoring capabilities.
 import os
 import logging
 from datetime import datetime, timedelta
+from security import security_manager
 
 # Security Configuration
 SECURITY_CONFIG = {
@@ -161,9 +162,13 @@ class SecurityMonitor:
     def __init__(self):
         self.logger = setup_security_logging()
         self.attack_attempts = {}
-        self.blocked_ips = set()
         self.suspicious_activity = []
     
+    @property
+    def blocked_ips(self):
+        """Blocked IPs, read from security_manager's snapshot (read-only)"""
+        return security_manager.get_blocked_ips()
+    
     def log_attack_attempt(self, ip_address, attack_type, details):
         """Log attack attempts for monitoring"""
         timestamp = datetime.now()
@@ -194,23 +199,24 @@ class SecurityMonitor:
     
     def block_ip(self, ip_address, reason):
         """Block an IP address"""
-        self.blocked_ips.add(ip_address)
+        security_manager.block_ip(ip_address)
         self.logger.warning(f"IP {ip_address} blocked: {reason}")
     
     def unblock_ip(self, ip_address):
         """Unblock an IP address"""
-        if ip_address in self.blocked_ips:
-            self.blocked_ips.remove(ip_address)
+        if security_manager.is_blocked(ip_address):
+            security_manager.unblock_ip(ip_address)
             self.logger.info(f"IP {ip_address} unblocked")
     
     def get_security_report(self):
         """Generate security report"""
+        blocked_ips = self.blocked_ips
         return {
             'timestamp': datetime.now().isoformat(),
-            'blocked_ips_count': len(self.blocked_ips),
+            'blocked_ips_count': len(blocked_ips),
             'attack_attempts_count': sum(len(attempts) for attempts in self.attack_attempts.values()),
             'recent_suspicious_activity': self.suspicious_activity[-10:],
-            'blocked_ips': list(self.blocked_ips)
+            'blocked_ips': list(blocked_ips)
         }
 
 # Initialize security monitor
@@ -55,6 +55,6 @@ echo "Security logs will be written to logs/security.log"
 echo "Press Ctrl+C to stop the server"
 echo "=================================================="
 
-# Start the secure server
-python3 secure_server.py
+# Start the secure server under gunicorn
+gunicorn -c gunicorn.conf.py secure_server:app
 